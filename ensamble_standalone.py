@@ -10,15 +10,42 @@ Script standalone para reproducir mi envío.
 6. Guarda los numero_de_cliente a estimular
 """
 
+from __future__ import annotations
+
 import os
+import re
 import sys
+import argparse
+import importlib
 import gc
+import copy
+import json
+import queue
+import socket
+import hashlib
 import logging
-import numpy as np
-import polars as pl
-import lightgbm as lgb
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from google.cloud import storage
+from concurrent.futures import ThreadPoolExecutor
+
+class _LazyModule:
+    """Importa el módulo recién en el primer acceso a un atributo"""
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# Backends pesados: solo se cargan si la etapa elegida los usa
+np = _LazyModule("numpy")
+pl = _LazyModule("polars")
+lgb = _LazyModule("lightgbm")
 
 # ============================================================================
 # CONFIGURACIÓN
@@ -35,6 +62,47 @@ VAL_MONTH = [202109]
 
 N_SUBMISSIONS = 11000
 
+# Artefactos intermedios para poder correr etapas por separado
+PREDICTIONS_DIR = "./predicciones"
+OUTPUT_FILE = "ensamble_meses_11000.csv"
+
+# Ganancia por cliente estimulado
+GANANCIA_ACIERTO = 780000
+COSTO_ESTIMULO = 20000
+
+# Ventanas de backtesting: cada modelo se entrena una vez por ventana con los
+# meses de su config <= train_until y se predicen todos los val_months juntos
+BACKTEST_WINDOWS = [
+    {'train_until': 202103, 'val_months': [202105, 202106, 202107, 202108, 202109]},
+    {'train_until': 202101, 'val_months': [202103, 202104, 202105, 202106, 202107]},
+]
+BACKTEST_N_WORKERS = 2
+BACKTEST_OUTPUT_FILE = "backtest_ganancias.csv"
+
+# Cantidad máxima de Datasets en memoria por adelantado del que se está entrenando
+# (contando el que se está construyendo)
+PREFETCH_MAX_DEPTH = 1
+# Solo se precarga el próximo modelo si la memoria disponible supera este múltiplo
+# del tamaño estimado de su matriz de entrenamiento
+PREFETCH_MEMORY_FACTOR = 3.0
+
+# Cache de predicciones por config y por modelo (parquet, desalojo LRU)
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_DIR = "./cache/resultados"
+RESULT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Autotune de parámetros de throughput (row/col-wise, num_threads) por host y dataset
+AUTOTUNE_ENABLED = True
+AUTOTUNE_CACHE_FILE = "./cache/autotune.json"
+AUTOTUNE_SAMPLE_ROWS = 200000
+AUTOTUNE_PROBE_ROUNDS = 10
+# Cada candidato se mide varias veces y se toma el mejor tiempo
+AUTOTUNE_PROBE_REPEATS = 3
+
+# Almacén de los boosters entrenados: un blob + manifest por modelo y un manifest por config
+MODEL_STORE_ENABLED = True
+MODEL_STORE_DIR = "./modelos"
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
@@ -413,6 +481,8 @@ def download_dataset_from_gcs(gcs_url: str, local_path: str):
     os.makedirs(os.path.dirname(local_path), exist_ok=True)
     
     # Descargar archivo
+    from google.cloud import storage
+    
     client = storage.Client()
     bucket = client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
@@ -421,6 +491,294 @@ def download_dataset_from_gcs(gcs_url: str, local_path: str):
     blob.download_to_filename(local_path)
     logger.info(f"Dataset descargado exitosamente en {local_path}")
 
+# ============================================================================
+# CACHE DE RESULTADOS
+# ============================================================================
+
+def dataset_fingerprint(path: str) -> str:
+    """Huella del archivo: tamaño más hash del footer del parquet (metadata y estadísticas)"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.seek(max(0, size - 65536))
+        tail = f.read()
+    return f"{size}-{hashlib.sha256(tail).hexdigest()}"
+
+def result_cache_key(kind: str, payload: dict) -> str:
+    """Hash del contenido que determina un resultado"""
+    raw = json.dumps({'kind': kind, **payload}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def _result_cache_path(key: str) -> str:
+    return os.path.join(RESULT_CACHE_DIR, f"{key}.parquet")
+
+def result_cache_get(key: str) -> pl.DataFrame | None:
+    """Devuelve el resultado cacheado o None"""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    
+    path = _result_cache_path(key)
+    try:
+        df = pl.read_parquet(path)
+        # Marcar como usado recientemente para el desalojo LRU
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, pl.exceptions.PolarsError) as e:
+        # Entrada truncada o corrupta: se descarta y se recalcula
+        logger.warning(f"Entrada de cache inválida {key[:12]} ({e}), se elimina")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return None
+    
+    logger.info(f"Resultado recuperado de cache: {key[:12]}")
+    return df
+
+def result_cache_put(key: str, df: pl.DataFrame):
+    """Guarda un resultado y desaloja los menos usados si se excede el tamaño"""
+    if not RESULT_CACHE_ENABLED:
+        return
+    
+    os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+    path = _result_cache_path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df.write_parquet(tmp_path)
+    os.replace(tmp_path, path)
+    
+    _evict_result_cache()
+
+def _evict_result_cache():
+    entries = []
+    for entry in os.scandir(RESULT_CACHE_DIR):
+        if entry.name.endswith('.parquet'):
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= RESULT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+# ============================================================================
+# INGENIERÍA DE FEATURES
+# ============================================================================
+
+# Sufijos históricos por cliente (ventana sobre foto_mes ordenado)
+_RE_LAG_DELTA = re.compile(r'^(.+)_(lag|delta)([1-9])$')
+_RE_VENTANA6 = re.compile(r'^(.+)_(min6|max6|ratioavg6|tend6)$')
+# Prefijos de ranking dentro de cada foto_mes
+_RANK_PREFIXES = ('rankp_', 'rankn_')
+
+# Features intermedias que no surgen de sufijos ni prefijos
+_FEATURES_DERIVADAS = {
+    'kmes': lambda: pl.col('foto_mes') % 100,
+    'mpayroll_sobre_edad': lambda: pl.col('mpayroll') / pl.col('cliente_edad'),
+    'ctrx_quarter_normalizado': lambda: (
+        pl.when(pl.col('cliente_antiguedad') == 1).then(pl.col('ctrx_quarter') * 5.0)
+        .when(pl.col('cliente_antiguedad') == 2).then(pl.col('ctrx_quarter') * 2.0)
+        .when(pl.col('cliente_antiguedad') == 3).then(pl.col('ctrx_quarter') * 1.2)
+        .otherwise(pl.col('ctrx_quarter').cast(pl.Float64))
+    ),
+}
+
+def _tendencia6(col: str) -> pl.Expr:
+    """Pendiente de la regresión lineal de col sobre los últimos 6 meses del cliente"""
+    x = pl.col(col).cast(pl.Float64)
+    valido = x.is_not_null().cast(pl.Float64)
+    # Índice del mes dentro del cliente (la ventana la aplica suma6)
+    t = pl.int_range(pl.len()).cast(pl.Float64) * valido
+    x = x.fill_null(0.0)
+    
+    def suma6(expr: pl.Expr) -> pl.Expr:
+        return expr.rolling_sum(6, min_samples=1).over('numero_de_cliente')
+    
+    n, st, sx = suma6(valido), suma6(t), suma6(x)
+    stx, stt = suma6(t * x), suma6(t * t)
+    denominador = n * stt - st * st
+    return pl.when(denominador != 0).then((n * stx - st * sx) / denominador)
+
+def _rank_cero_fijo(col: str) -> pl.Expr:
+    """Ranking con signo dentro del mes: positivos en (0, 1], cero en 0, negativos en [-1, 0)"""
+    x = pl.col(col)
+    pos = pl.when(x > 0).then(x)
+    neg = pl.when(x < 0).then(-x)
+    rank_pos = (pos.rank('average') / pos.count()).over('foto_mes')
+    rank_neg = (neg.rank('average') / neg.count()).over('foto_mes')
+    return pl.when(x > 0).then(rank_pos).when(x < 0).then(-rank_neg).when(x == 0).then(0.0)
+
+def _feature_expr(name: str) -> tuple[pl.Expr, list[str]] | None:
+    """Expresión que deriva name y las columnas de las que depende, o None si no se reconoce"""
+    for prefix in _RANK_PREFIXES:
+        if name.startswith(prefix):
+            base = name[len(prefix):]
+            if prefix == 'rankp_':
+                expr = (pl.col(base).rank('average') / pl.col(base).count()).over('foto_mes')
+            else:
+                expr = _rank_cero_fijo(base)
+            return expr, [base]
+    
+    match = _RE_LAG_DELTA.match(name)
+    if match:
+        base, kind, k = match.group(1), match.group(2), int(match.group(3))
+        lag = pl.col(base).shift(k).over('numero_de_cliente')
+        expr = lag if kind == 'lag' else pl.col(base) - lag
+        return expr, [base]
+    
+    match = _RE_VENTANA6.match(name)
+    if match:
+        base, kind = match.group(1), match.group(2)
+        if kind == 'min6':
+            expr = pl.col(base).rolling_min(6, min_samples=1).over('numero_de_cliente')
+        elif kind == 'max6':
+            expr = pl.col(base).rolling_max(6, min_samples=1).over('numero_de_cliente')
+        elif kind == 'ratioavg6':
+            expr = pl.col(base) / pl.col(base).rolling_mean(6, min_samples=1).over('numero_de_cliente')
+        else:
+            expr = _tendencia6(base)
+        return expr, [base]
+    
+    if name in _FEATURES_DERIVADAS:
+        expr = _FEATURES_DERIVADAS[name]()
+        return expr, expr.meta.root_names()
+    
+    return None
+
+def _resolve_features(
+    features: list[str],
+    base_columns: set[str]
+) -> tuple[dict[str, pl.Expr], dict[str, int], list[str]]:
+    """
+    Resuelve recursivamente qué columnas hay que calcular y a qué profundidad.
+    Devuelve también las que no están en la base y no se saben derivar.
+    """
+    exprs, depth, missing = {}, {}, []
+    
+    def resolve(name: str) -> int:
+        if name in base_columns:
+            return 0
+        if name in depth:
+            return depth[name]
+        resolved = _feature_expr(name)
+        if resolved is None:
+            if name not in missing:
+                missing.append(name)
+            return 0
+        expr, deps = resolved
+        depth[name] = 1 + max((resolve(dep) for dep in deps), default=0)
+        exprs[name] = expr
+        return depth[name]
+    
+    for name in features:
+        resolve(name)
+    
+    return exprs, depth, missing
+
+def build_features(
+    base: str | pl.LazyFrame,
+    features: list[str],
+    months: list[int] | None = None
+) -> pl.LazyFrame:
+    """
+    Agrega en modo lazy solo las columnas de features que no están en la tabla mensual base.
+    Las columnas que ya existen se usan tal cual; las derivadas se calculan en capas según
+    sus dependencias (por ej. rankp_x_lag1 necesita x_lag1 antes).
+    
+    Las columnas con sufijo _1 (por ej. rankp_cproductos_1, thomebanking_1) vienen así
+    del dataset original y su definición no está en este repo: la base debe traerlas.
+    Las fórmulas de rankp_/rankn_, _ratioavg6, _tend6 y las de _FEATURES_DERIVADAS son
+    propias de esta etapa; check_features las compara contra un dataset existente.
+    """
+    lf = pl.scan_parquet(base, low_memory=True) if isinstance(base, str) else base
+    base_columns = set(lf.collect_schema().names())
+    
+    exprs, depth, missing = _resolve_features(features, base_columns)
+    if missing:
+        raise ValueError(
+            f"No se saben derivar {len(missing)} features y la tabla base no las trae: {missing}"
+        )
+    
+    logger.info(f"Features a derivar: {len(exprs)} (de {len(features)} pedidas)")
+    
+    # Las ventanas por cliente asumen filas ordenadas por mes
+    lf = lf.sort(['numero_de_cliente', 'foto_mes'])
+    for level in range(1, max(depth.values(), default=0) + 1):
+        lf = lf.with_columns([exprs[name].alias(name) for name in exprs if depth[name] == level])
+    
+    keep = list(dict.fromkeys(['numero_de_cliente', 'foto_mes', 'clase_ternaria'] + list(features)))
+    lf = lf.select([c for c in keep if c in base_columns or c in exprs])
+    
+    if months is not None:
+        lf = lf.filter(pl.col('foto_mes').is_in(months))
+    
+    return lf
+
+def check_features(
+    dataset_path: str,
+    features: list[str],
+    month: int,
+    rtol: float = 1e-6,
+    atol: float = 1e-9
+) -> pl.DataFrame:
+    """
+    Deriva para un mes las features que el dataset ya trae (quitándolas de la base) y
+    devuelve, por feature, la fracción de filas que coincide con la columna existente.
+    """
+    lf = pl.scan_parquet(dataset_path, low_memory=True)
+    columns = set(lf.collect_schema().names())
+    keys = ['numero_de_cliente', 'foto_mes']
+    
+    # Solo las que existen y se pueden derivar desde el resto de las columnas
+    candidates = [f for f in dict.fromkeys(features) if f in columns and _feature_expr(f) is not None]
+    base_columns = columns - set(candidates)
+    checked = [f for f in candidates if not _resolve_features([f], base_columns)[2]]
+    if not checked:
+        raise ValueError("Ninguna de las features pedidas se puede derivar desde el dataset")
+    
+    months_available = sorted(lf.select(pl.col('foto_mes').unique()).collect()['foto_mes'].to_list())
+    if month not in months_available:
+        raise ValueError(f"El mes {month} no está en {dataset_path}")
+    # Historia suficiente para lags y ventanas de 6 meses
+    window = [m for m in months_available if m <= month][-7:]
+    
+    base = lf.filter(pl.col('foto_mes').is_in(window)).drop(checked)
+    derived = build_features(base, checked, months=[month]).select(keys + checked)
+    original = lf.filter(pl.col('foto_mes') == month).select(keys + checked)
+    joined = original.join(derived, on=keys, how='left', suffix='_derivada').collect()
+    
+    rows = []
+    for name in checked:
+        a = joined[name].cast(pl.Float64).fill_nan(None)
+        b = joined[f'{name}_derivada'].cast(pl.Float64).fill_nan(None)
+        diff = (a - b).abs()
+        ok = (a.is_null() & b.is_null()) | (diff <= atol + rtol * a.abs()).fill_null(False)
+        rows.append({'feature': name, 'coincidencia': ok.mean(), 'max_abs_diff': diff.max()})
+    
+    report = pl.DataFrame(rows).sort('coincidencia')
+    n_diff = report.filter(pl.col('coincidencia') < 1.0).height
+    logger.info(f"Features verificadas: {len(checked)}, con diferencias: {n_diff}")
+    return report
+
+def write_feature_dataset(base_path: str, output_path: str, feature_sets: list[str]):
+    """Materializa un dataset con solo las columnas de los feature sets pedidos"""
+    features = []
+    for feature_set in feature_sets:
+        if feature_set not in FEATURE_SETS:
+            raise ValueError(f"Feature set '{feature_set}' no encontrado en FEATURE_SETS")
+        features.extend(FEATURE_SETS[feature_set])
+    
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    build_features(base_path, features).sink_parquet(output_path)
+    logger.info(f"Dataset de features guardado en {output_path}")
+
 # ============================================================================
 # FUNCIONES DE CARGA DE DATOS
 # ============================================================================
@@ -507,6 +865,23 @@ def load_dataset_undersampling_efficient(
     
     return df
 
+def load_labels(path_parquet: str, months: list[int]) -> pl.DataFrame:
+    """Carga solo las columnas necesarias para calcular la ganancia"""
+    if isinstance(months, str):
+        months = [months]
+    
+    df = (
+        pl.scan_parquet(path_parquet, low_memory=True)
+        .filter(pl.col("foto_mes").is_in(months))
+        .select([
+            pl.col("numero_de_cliente"),
+            pl.col("foto_mes"),
+            pl.when(pl.col("clase_ternaria") == "BAJA+2").then(1).otherwise(0).alias("y_true")
+        ])
+        .collect()
+    )
+    return df
+
 # ============================================================================
 # FUNCIONES DE ENTRENAMIENTO Y PREDICCIÓN
 # ============================================================================
@@ -577,119 +952,714 @@ def merge_predictions(pred_acumuladas: pl.DataFrame, n_submissions: int = 10000)
     
     return pred_final
 
+def ensemble_configs(pred_configs: list[pl.DataFrame]) -> pl.DataFrame:
+    """Promedia las predicciones de varias configs (y_pred_mean de cada una)"""
+    ensemble_df = None
+    pred_cols = []
+    
+    for config_idx, pred_df in enumerate(pred_configs):
+        col = f'y_pred_config{config_idx + 1}'
+        pred_cols.append(col)
+        pred_df_renamed = pred_df.select(['numero_de_cliente', 'foto_mes', 'y_pred_mean']).rename(
+            {'y_pred_mean': col}
+        )
+        
+        if ensemble_df is None:
+            ensemble_df = pred_df_renamed
+        else:
+            ensemble_df = ensemble_df.join(
+                pred_df_renamed,
+                on=['numero_de_cliente', 'foto_mes'],
+                how='full',
+                coalesce=True
+            )
+    
+    # Suma explícita: si algún cliente falta en una config el promedio queda nulo
+    suma = pl.col(pred_cols[0])
+    for col in pred_cols[1:]:
+        suma = suma + pl.col(col)
+    
+    return ensemble_df.with_columns(
+        (suma / float(len(pred_cols))).alias('y_pred_mean')
+    ).select(['numero_de_cliente', 'foto_mes', 'y_pred_mean'])
+
+def calcular_ganancia_por_mes(
+    pred_df: pl.DataFrame,
+    df_labels: pl.DataFrame,
+    n_submissions: int = 11000
+) -> pl.DataFrame:
+    """Ganancia de estimular el top n_submissions de cada foto_mes"""
+    return (
+        pred_df
+        .join(df_labels, on=['numero_de_cliente', 'foto_mes'], how='left')
+        .with_columns(
+            pl.col('y_pred_mean').rank('ordinal', descending=True).over('foto_mes').alias('rank')
+        )
+        .filter(pl.col('rank') <= n_submissions)
+        .group_by('foto_mes')
+        .agg(
+            pl.when(pl.col('y_true') == 1)
+            .then(GANANCIA_ACIERTO)
+            .otherwise(-COSTO_ESTIMULO)
+            .sum()
+            .alias('ganancia')
+        )
+        .sort('foto_mes')
+    )
+
 # ============================================================================
-# FUNCIONES ORQUESTADORAS
+# ALMACÉN DE MODELOS
 # ============================================================================
 
-def execute_config(config: dict, dataset_path: str, val_months: list[int]) -> pl.DataFrame:
-    """Ejecuta una configuración completa y retorna predicciones finales"""
-    experiment_name = config['experiment_name']
-    logger.info(f"=== Ejecutando {experiment_name} ===")
-    
-    fixed_params = config['fixed_params']
-    model_names = [key for key in config.keys() if key.startswith("model_")]
-    model_names.sort()
-    
-    logger.info(f"Modelos a ejecutar: {model_names}")
+STORE_BLOB_FILE = "boosters.bin"
+STORE_MANIFEST_FILE = "manifest.json"
+STORE_FORMAT_VERSION = 2
+
+# Un lock por almacén para publicar blob y manifest sin pisarse entre hilos
+_STORE_LOCKS_GUARD = threading.Lock()
+_STORE_LOCKS = {}
+
+def _store_lock(store_dir: str) -> threading.Lock:
+    with _STORE_LOCKS_GUARD:
+        return _STORE_LOCKS.setdefault(os.path.abspath(store_dir), threading.Lock())
+
+class EnsembleStoreWriter:
+    """
+    Escribe los boosters del semillerío de un modelo en un único blob a medida que se
+    entrenan. El manifest (offsets, features y pesos) se escribe al cerrar, así un
+    almacén incompleto nunca queda visible.
+    """
     
-    df_valid = load_dataset(path_parquet=dataset_path, months=val_months)
+    def __init__(self, store_dir: str, model_name: str, group_key: str, features: list[str]):
+        self.store_dir = store_dir
+        self.model_name = model_name
+        self.group_key = group_key
+        self.features = features
+        self.boosters = []
+        self._offset = 0
+        
+        os.makedirs(store_dir, exist_ok=True)
+        self._tmp_suffix = f"{os.getpid()}.{threading.get_ident()}.{id(self)}.tmp"
+        self._blob_tmp = os.path.join(store_dir, f"{STORE_BLOB_FILE}.{self._tmp_suffix}")
+        self._fh = open(self._blob_tmp, 'wb')
     
-    model_predictions = []
+    def add(self, seed: int, model: lgb.Booster):
+        data = model.model_to_string().encode('utf-8')
+        self._fh.write(data)
+        self.boosters.append({'seed': seed, 'offset': self._offset, 'length': len(data)})
+        self._offset += len(data)
     
-    for model_name in model_names:
-        logger.info(f"\n--- Procesando {model_name} ---")
-        model_config = config[model_name]
-        
-        features_all = []
-        for feature_name in model_config['chosen_features']:
-            if feature_name in FEATURE_SETS:
-                features_all.extend(FEATURE_SETS[feature_name])
-            else:
-                raise ValueError(f"Feature set '{feature_name}' no encontrado en FEATURE_SETS")
-        features_all = list(set(features_all))
+    def close(self):
+        self._fh.close()
         
-        if 'clase_ternaria' in features_all:
-            features_all.remove('clase_ternaria')
+        # Promedio simple del semillerío, como en _train_semillerio
+        for booster in self.boosters:
+            booster['weight'] = 1.0 / len(self.boosters)
         
-        features_train = features_all.copy()
+        manifest = {
+            'format_version': STORE_FORMAT_VERSION,
+            'model_name': self.model_name,
+            'group_key': self.group_key,
+            'features': self.features,
+            'boosters': self.boosters,
+        }
+        manifest_path = os.path.join(self.store_dir, STORE_MANIFEST_FILE)
         
-        params = model_config['params'].copy()
-        params.update(fixed_params)
+        with _store_lock(self.store_dir):
+            # Otro hilo ya publicó el mismo modelo (misma clave): no reemplazar un almacén en uso
+            if os.path.exists(manifest_path):
+                logger.info(f"Almacén de {self.model_name} ya publicado en {self.store_dir}, se descarta esta copia")
+                os.remove(self._blob_tmp)
+                return
+            
+            manifest_tmp = f"{manifest_path}.{self._tmp_suffix}"
+            with open(manifest_tmp, 'w') as f:
+                json.dump(manifest, f, indent=2)
+            
+            os.replace(self._blob_tmp, os.path.join(self.store_dir, STORE_BLOB_FILE))
+            os.replace(manifest_tmp, manifest_path)
+        logger.info(f"Modelos de {self.model_name} guardados en {self.store_dir} ({self._offset / 1024 ** 2:.1f} MB)")
+    
+    def abort(self):
+        self._fh.close()
+        if os.path.exists(self._blob_tmp):
+            os.remove(self._blob_tmp)
+
+def write_config_manifest(path: str, experiment_name: str, groups: dict[str, str]):
+    """Manifest de una config: qué almacén usa cada modelo y con qué peso se promedia"""
+    manifest = {
+        'format_version': STORE_FORMAT_VERSION,
+        'experiment_name': experiment_name,
+        'models': {
+            model_name: {'store_dir': store_dir, 'weight': 1.0 / len(groups)}
+            for model_name, store_dir in sorted(groups.items())
+        },
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+class EnsembleStore:
+    """Almacén de solo lectura de una config: cada booster se lee y parsea recién al usarlo"""
+    
+    def __init__(self, config_manifest_path: str):
+        with open(config_manifest_path) as f:
+            self.manifest = json.load(f)
+        if self.manifest['format_version'] != STORE_FORMAT_VERSION:
+            raise ValueError(f"Versión de almacén no soportada: {self.manifest['format_version']}")
         
-        months = model_config['months']
-        undersampling_fraction = model_config.get('undersampling_fraction', 1.0)
-        semillerio = model_config.get('semillerio', 1)
-        n_submissions = model_config.get('n_submissions', 11000)
+        self.groups = {}
+        for model_name, entry in self.manifest['models'].items():
+            with open(os.path.join(entry['store_dir'], STORE_MANIFEST_FILE)) as f:
+                self.groups[model_name] = json.load(f)
+        self._boosters = {}
+    
+    @property
+    def model_names(self) -> list[str]:
+        return sorted(self.manifest['models'].keys())
+    
+    def booster(self, model_name: str, seed: int) -> lgb.Booster:
+        key = (model_name, seed)
+        if key not in self._boosters:
+            entry = next(b for b in self.groups[model_name]['boosters'] if b['seed'] == seed)
+            blob_path = os.path.join(self.manifest['models'][model_name]['store_dir'], STORE_BLOB_FILE)
+            with open(blob_path, 'rb') as f:
+                f.seek(entry['offset'])
+                model_str = f.read(entry['length']).decode('utf-8')
+            self._boosters[key] = lgb.Booster(model_str=model_str)
+        return self._boosters[key]
+    
+    def predict(self, df: pl.DataFrame) -> pl.DataFrame:
+        """Predicción ponderada de todos los boosters del almacén"""
+        y_pred = np.zeros(df.height)
         
-        use_undersampling = (undersampling_fraction is not None and 
-                            undersampling_fraction < 1.0 and 
-                            undersampling_fraction > 0.0)
+        for model_name in self.model_names:
+            group = self.groups[model_name]
+            model_weight = self.manifest['models'][model_name]['weight']
+            X = df.select(group['features']).to_numpy()
+            for booster in group['boosters']:
+                y_pred += model_weight * booster['weight'] * self.booster(model_name, booster['seed']).predict(X)
+            del X
         
-        if use_undersampling:
-            df_train = load_dataset_undersampling_efficient(
-                path_parquet=dataset_path,
-                months=months,
-                fraction=undersampling_fraction,
-                seed=0,  # Seed base para el primer experimento
-                stratified=False
-            )
+        return pl.DataFrame({
+            "numero_de_cliente": df["numero_de_cliente"],
+            "foto_mes": df["foto_mes"],
+            "y_pred_mean": y_pred
+        })
+    
+    def close(self):
+        self._boosters.clear()
+
+# ============================================================================
+# FUNCIONES ORQUESTADORAS
+# ============================================================================
+
+def resolve_features(model_config: dict) -> list[str]:
+    """Une los feature sets elegidos por un modelo"""
+    features_all = []
+    for feature_name in model_config['chosen_features']:
+        if feature_name in FEATURE_SETS:
+            features_all.extend(FEATURE_SETS[feature_name])
         else:
-            df_train = load_dataset(path_parquet=dataset_path, months=months)
-        
-        X_train = df_train.select(features_train).to_numpy()
-        y_train = df_train["y_train"].to_numpy()
-        w_train = df_train["w_train"].to_numpy()
-        
-        dtrain = lgb.Dataset(
-            X_train,
-            label=y_train,
-            weight=w_train,
-            feature_name=features_train,
-            free_raw_data=True
+            raise ValueError(f"Feature set '{feature_name}' no encontrado en FEATURE_SETS")
+    # Sin duplicados y en orden estable entre ejecuciones
+    features_all = list(dict.fromkeys(features_all))
+    
+    if 'clase_ternaria' in features_all:
+        features_all.remove('clase_ternaria')
+    
+    return features_all
+
+def model_params(config: dict, model_name: str) -> dict:
+    """Parámetros del modelo con los fixed_params de la config aplicados encima"""
+    params = config[model_name]['params'].copy()
+    params.update(config['fixed_params'])
+    return params
+
+def build_train_dataset(
+    model_config: dict,
+    params: dict,
+    dataset_path: str
+) -> tuple[lgb.Dataset, list[str]]:
+    """Carga los meses de entrenamiento y construye el Dataset de LightGBM"""
+    features_train = resolve_features(model_config)
+    
+    months = model_config['months']
+    undersampling_fraction = model_config.get('undersampling_fraction', 1.0)
+    
+    use_undersampling = (undersampling_fraction is not None and 
+                        undersampling_fraction < 1.0 and 
+                        undersampling_fraction > 0.0)
+    
+    if use_undersampling:
+        df_train = load_dataset_undersampling_efficient(
+            path_parquet=dataset_path,
+            months=months,
+            fraction=undersampling_fraction,
+            seed=0,  # Seed base para el primer experimento
+            stratified=False
         )
+    else:
+        df_train = load_dataset(path_parquet=dataset_path, months=months)
+    
+    X_train = df_train.select(features_train).to_numpy()
+    y_train = df_train["y_train"].to_numpy()
+    w_train = df_train["w_train"].to_numpy()
+    
+    # Construir con los mismos parámetros que usa el primer modelo del semillerío
+    # para que el binning sea idéntico al de construirlo dentro de lgb.train
+    dataset_params = params.copy()
+    dataset_params['seed'] = 0
+    dataset_params['deterministic'] = True
+    dataset_params['verbose'] = -1
+    
+    dtrain = lgb.Dataset(
+        X_train,
+        label=y_train,
+        weight=w_train,
+        feature_name=features_train,
+        params=dataset_params,
+        free_raw_data=True
+    )
+    dtrain.construct()
+    
+    del df_train, X_train, y_train, w_train
+    gc.collect()
+    
+    return dtrain, features_train
+
+def _available_memory() -> int | None:
+    """
+    Memoria disponible en bytes, o None si no se puede determinar. MemAvailable incluye
+    el page cache recuperable (que el scan del parquet llena); MemFree no.
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def _rows_per_month(dataset_path: str) -> dict[int, int]:
+    """Cantidad de registros de cada foto_mes (lee solo esa columna)"""
+    counts = (
+        pl.scan_parquet(dataset_path, low_memory=True)
+        .group_by('foto_mes')
+        .agg(pl.len().alias('n'))
+        .collect()
+    )
+    return dict(zip(counts['foto_mes'].to_list(), counts['n'].to_list()))
+
+def _estimate_matrix_bytes(model_config: dict, rows_per_month: dict[int, int]) -> int:
+    """Tamaño aproximado de X_train (float64) de un modelo"""
+    n_rows = sum(rows_per_month.get(month, 0) for month in model_config['months'])
+    fraction = model_config.get('undersampling_fraction', 1.0)
+    # El undersampling solo toca a CONTINUA, que es casi todo el dataset
+    if fraction is not None and 0.0 < fraction < 1.0:
+        n_rows = int(n_rows * fraction)
+    return n_rows * len(resolve_features(model_config)) * 8
+
+class _ProbeGate:
+    """
+    Lock lectores/escritor para que las mediciones del autotune no compitan por los cores:
+    construir Datasets y entrenar toman el lado compartido, los probes el exclusivo.
+    Un probe esperando bloquea a los nuevos lectores para no quedar postergado.
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+    
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                self._cond.notify_all()
+    
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+_PROBE_GATE = _ProbeGate()
+
+class _PrefetchSlots:
+    """
+    Cupos de Datasets en memoria de una corrida: uno para el que se entrena más
+    PREFETCH_MAX_DEPTH por adelantado. El loader toma el cupo antes de construir
+    y el consumidor lo libera al terminar de entrenar ese Dataset.
+    """
+    
+    def __init__(self, size: int):
+        self.size = size
+        self.in_use = 0
+        self._cond = threading.Condition()
+    
+    def acquire(self, stop_event: threading.Event) -> bool:
+        with self._cond:
+            while self.in_use >= self.size:
+                if stop_event.is_set():
+                    return False
+                self._cond.wait(0.5)
+            self.in_use += 1
+            return True
+    
+    def release(self):
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify_all()
+
+# Bytes que los loaders (de todas las corridas en paralelo) están por alocar
+_PREFETCH_MEMORY_LOCK = threading.Lock()
+_prefetch_reserved_bytes = 0
+
+def _reserve_prefetch_memory(
+    n_bytes: int,
+    slots: _PrefetchSlots,
+    stop_event: threading.Event,
+    model_name: str
+) -> bool:
+    """Espera a que haya memoria libre para construir un Dataset de n_bytes y la reserva"""
+    global _prefetch_reserved_bytes
+    waiting = False
+    
+    while not stop_event.is_set():
+        with _PREFETCH_MEMORY_LOCK:
+            available = _available_memory()
+            free = None if available is None else available - _prefetch_reserved_bytes
+            # Si no hay otro Dataset de esta corrida en memoria no es precarga: se construye igual
+            if free is None or slots.in_use <= 1 or free >= PREFETCH_MEMORY_FACTOR * n_bytes:
+                _prefetch_reserved_bytes += n_bytes
+                return True
         
-        del df_train, X_train, y_train, w_train
-        gc.collect()
-        
-        # Entrenar semillerío
-        pred_acumuladas = None
-        semillerio_seeds = [i for i in range(semillerio)]
+        if not waiting:
+            logger.info(f"Memoria libre insuficiente para precargar {model_name}, esperando")
+            waiting = True
+        stop_event.wait(0.5)
+    
+    return False
+
+def _release_prefetch_memory(n_bytes: int):
+    global _prefetch_reserved_bytes
+    with _PREFETCH_MEMORY_LOCK:
+        _prefetch_reserved_bytes -= n_bytes
+
+def _prefetch_train_datasets(
+    jobs: list[tuple[dict, str]],
+    dataset_path: str,
+    prefetch_queue: queue.Queue,
+    slots: _PrefetchSlots,
+    stop_event: threading.Event
+):
+    """Productor: prepara los Datasets de entrenamiento en el orden de jobs (config, modelo)"""
+    try:
+        rows_per_month = _rows_per_month(dataset_path) if jobs else {}
         
-        for sem_idx, sem_seed in enumerate(semillerio_seeds):
-            logger.info(f"  Entrenando modelo {sem_idx + 1}/{semillerio} (seed {sem_seed})")
+        for config, model_name in jobs:
+            if not slots.acquire(stop_event):
+                return
             
-            params_sem = params.copy()
-            params_sem["seed"] = sem_seed
-            params_sem["verbose"] = -1
+            estimate = _estimate_matrix_bytes(config[model_name], rows_per_month)
+            if not _reserve_prefetch_memory(estimate, slots, stop_event, model_name):
+                slots.release()
+                return
             
-            # Entrenar modelo
-            model = train_model(params=params_sem, dtrain=dtrain, features=features_train)
-            
-            # Predecir
-            resultados = predict_testset(modelo=model, months=val_months, df=df_valid)
+            try:
+                logger.info(f"Preparando Dataset de {config['experiment_name']}/{model_name}")
+                params = model_params(config, model_name)
+                with _PROBE_GATE.shared():
+                    dtrain, features_train = build_train_dataset(
+                        config[model_name], params, dataset_path
+                    )
+            finally:
+                _release_prefetch_memory(estimate)
             
-            # Acumular predicciones
-            pred_df = resultados.select(['numero_de_cliente', 'foto_mes', 'y_pred']).clone()
-            pred_df = pred_df.rename({'y_pred': f'y_pred_{sem_seed}'})
+            prefetch_queue.put((config['experiment_name'], model_name, dtrain, features_train))
+            del dtrain
+    except BaseException as e:
+        prefetch_queue.put(e)
+
+_AUTOTUNE_LOCK = threading.Lock()
+
+def _autotune_candidates(params: dict) -> list[dict]:
+    """Combinaciones de histograma row/col-wise y cantidad de threads a probar"""
+    layouts = [
+        {'force_row_wise': True, 'force_col_wise': False},
+        {'force_row_wise': False, 'force_col_wise': True},
+    ]
+    
+    # Si la config fija num_threads (por ej. en el backtest) se respeta
+    if 'num_threads' in params:
+        threads = [params['num_threads']]
+    else:
+        n_cpu = os.cpu_count() or 1
+        threads = sorted({max(1, n_cpu // d) for d in (1, 2, 4)}, reverse=True)
+    
+    return [{**layout, 'num_threads': n} for layout in layouts for n in threads]
+
+def _trees_signature(model: lgb.Booster) -> str:
+    """Texto de los árboles sin la sección de parámetros"""
+    return model.model_to_string().split('end of trees')[0]
+
+def _load_autotune_cache() -> dict:
+    try:
+        with open(AUTOTUNE_CACHE_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def autotune_params(params: dict, dtrain: lgb.Dataset, fingerprint: str) -> dict:
+    """
+    Elige la configuración de entrenamiento más rápida que produce los mismos árboles
+    que params, con entrenamientos cortos sobre una muestra del Dataset construido.
+    La decisión solo vale para lo que se verificó: se cachea por host, dataset
+    (huella y features) y parámetros completos.
+    """
+    num_data = dtrain.num_data()
+    features = dtrain.get_feature_name()
+    cache_key = result_cache_key('autotune', {
+        'host': socket.gethostname(),
+        'n_cpu': os.cpu_count(),
+        'dataset': fingerprint,
+        'num_data': num_data,
+        'features': features,
+        'params': {k: v for k, v in params.items() if k not in ('seed', 'verbose')},
+    })
+    
+    with _AUTOTUNE_LOCK:
+        cached = _load_autotune_cache().get(cache_key)
+    if cached is not None:
+        logger.info(f"Autotune recuperado de cache: {cached}")
+        return cached
+    
+    rng = np.random.default_rng(0)
+    sample_size = min(AUTOTUNE_SAMPLE_ROWS, num_data)
+    indices = np.sort(rng.choice(num_data, size=sample_size, replace=False))
+    
+    probe_params = params.copy()
+    probe_params['seed'] = 0
+    probe_params['verbose'] = -1
+    probe_params['num_boost_round'] = AUTOTUNE_PROBE_ROUNDS
+    
+    dsample = dtrain.subset(indices.tolist())
+    dsample.construct()
+    
+    def probe(candidate: dict) -> tuple[str, float]:
+        """Árboles y mejor tiempo de AUTOTUNE_PROBE_REPEATS entrenamientos"""
+        candidate_params = {**probe_params, **candidate}
+        times = []
+        for _ in range(AUTOTUNE_PROBE_REPEATS):
+            t0 = time.perf_counter()
+            model = train_model(params=candidate_params, dtrain=dsample, features=features)
+            times.append(time.perf_counter() - t0)
+        return _trees_signature(model), min(times)
+    
+    # Sin loaders ni otros entrenamientos corriendo mientras se mide
+    with _PROBE_GATE.exclusive():
+        # Referencia: los parámetros tal como están en la config
+        reference, reference_time = probe({})
+        logger.info(f"Autotune: referencia -> {reference_time:.2f}s")
+        
+        best, best_time = {}, reference_time
+        for candidate in _autotune_candidates(params):
+            signature, elapsed = probe(candidate)
             
-            if pred_acumuladas is None:
-                base_cols = resultados.select(['numero_de_cliente', 'foto_mes']).clone()
-                pred_acumuladas = base_cols.join(pred_df, on=['numero_de_cliente', 'foto_mes'], how='left')
-            else:
-                pred_acumuladas = pred_acumuladas.join(pred_df, on=['numero_de_cliente', 'foto_mes'], how='left')
+            if signature != reference:
+                logger.info(f"Autotune: {candidate} descartado, árboles distintos")
+                continue
             
-            del model
-            gc.collect()
+            logger.info(f"Autotune: {candidate} -> {elapsed:.2f}s")
+            # Si ninguno le gana a la referencia se dejan los parámetros originales
+            if elapsed < best_time:
+                best, best_time = candidate, elapsed
+    
+    with _AUTOTUNE_LOCK:
+        cache = _load_autotune_cache()
+        cache[cache_key] = best
+        os.makedirs(os.path.dirname(AUTOTUNE_CACHE_FILE), exist_ok=True)
+        with open(AUTOTUNE_CACHE_FILE, 'w') as f:
+            json.dump(cache, f, indent=2)
+    
+    logger.info(f"Autotune elegido: {best}")
+    return best
+
+def _train_semillerio(
+    config: dict,
+    model_name: str,
+    dtrain: lgb.Dataset,
+    features_train: list[str],
+    df_valid: pl.DataFrame,
+    val_months: list[int],
+    fingerprint: str,
+    store_writer: EnsembleStoreWriter | None = None
+) -> pl.DataFrame:
+    """Entrena el semillerío de un modelo y promedia sus predicciones"""
+    logger.info(f"\n--- Procesando {model_name} ---")
+    model_config = config[model_name]
+    params = model_params(config, model_name)
+    
+    semillerio = model_config.get('semillerio', 1)
+    n_submissions = model_config.get('n_submissions', 11000)
+    
+    if AUTOTUNE_ENABLED:
+        params.update(autotune_params(params, dtrain, fingerprint))
+    
+    # Entrenar semillerío
+    pred_acumuladas = None
+    semillerio_seeds = [i for i in range(semillerio)]
+    
+    for sem_idx, sem_seed in enumerate(semillerio_seeds):
+        logger.info(f"  Entrenando modelo {sem_idx + 1}/{semillerio} (seed {sem_seed})")
         
-        # Merge de predicciones del semillerio
-        pred_final_model = merge_predictions(pred_acumuladas, n_submissions=n_submissions)
+        params_sem = params.copy()
+        params_sem["seed"] = sem_seed
+        params_sem["verbose"] = -1
         
-        # Guardar predicción final de este modelo
-        model_predictions.append(pred_final_model.select(['numero_de_cliente', 'foto_mes', 'y_pred_mean']))
+        # Entrenar modelo
+        with _PROBE_GATE.shared():
+            model = train_model(params=params_sem, dtrain=dtrain, features=features_train)
+        
+        if store_writer is not None:
+            store_writer.add(sem_seed, model)
+        
+        # Predecir
+        resultados = predict_testset(modelo=model, months=val_months, df=df_valid)
         
-        del pred_acumuladas, pred_final_model, dtrain
+        # Acumular predicciones
+        pred_df = resultados.select(['numero_de_cliente', 'foto_mes', 'y_pred']).clone()
+        pred_df = pred_df.rename({'y_pred': f'y_pred_{sem_seed}'})
+        
+        if pred_acumuladas is None:
+            base_cols = resultados.select(['numero_de_cliente', 'foto_mes']).clone()
+            pred_acumuladas = base_cols.join(pred_df, on=['numero_de_cliente', 'foto_mes'], how='left')
+        else:
+            pred_acumuladas = pred_acumuladas.join(pred_df, on=['numero_de_cliente', 'foto_mes'], how='left')
+        
+        del model
         gc.collect()
     
+    # Merge de predicciones del semillerio
+    pred_final_model = merge_predictions(pred_acumuladas, n_submissions=n_submissions)
+    
+    return pred_final_model
+
+def model_cache_key(config: dict, model_name: str, fingerprint: str, val_months: list[int]) -> str:
+    """Clave de cache de las predicciones de un modelo"""
+    return result_cache_key('model', {
+        'model_config': config[model_name],
+        'fixed_params': config['fixed_params'],
+        'features': resolve_features(config[model_name]),
+        'dataset': fingerprint,
+        'val_months': sorted(val_months),
+    })
+
+def config_cache_key(config: dict, fingerprint: str, val_months: list[int]) -> str:
+    """Clave de cache de las predicciones de una config completa"""
+    model_names = sorted(key for key in config.keys() if key.startswith("model_"))
+    return result_cache_key('config', {
+        'models': [model_cache_key(config, name, fingerprint, val_months) for name in model_names],
+        'dataset': fingerprint,
+        'val_months': sorted(val_months),
+    })
+
+def model_store_dir(config: dict, model_name: str, fingerprint: str) -> tuple[str, str]:
+    """Directorio y clave del almacén de un modelo (no depende de los meses a predecir)"""
+    group_key = result_cache_key('store', {
+        'model_config': config[model_name],
+        'fixed_params': config['fixed_params'],
+        'features': resolve_features(config[model_name]),
+        'dataset': fingerprint,
+    })
+    return os.path.join(MODEL_STORE_DIR, 'grupos', group_key[:16]), group_key
+
+def model_store_exists(config: dict, model_name: str, fingerprint: str) -> bool:
+    store_dir, _ = model_store_dir(config, model_name, fingerprint)
+    return os.path.exists(os.path.join(store_dir, STORE_MANIFEST_FILE))
+
+def config_manifest_path(config: dict, fingerprint: str) -> str:
+    """Manifest de la config, identificado por los almacenes de sus modelos"""
+    model_names = sorted(key for key in config.keys() if key.startswith("model_"))
+    config_key = result_cache_key('store_config', {
+        'models': [model_store_dir(config, name, fingerprint)[1] for name in model_names],
+    })
+    return os.path.join(MODEL_STORE_DIR, config['experiment_name'], f"{config_key[:16]}.json")
+
+def predict_from_store(config: dict, dataset_path: str, val_months: list[int]) -> pl.DataFrame:
+    """Predice val_months con los boosters ya guardados de una config"""
+    manifest_path = config_manifest_path(config, dataset_fingerprint(dataset_path))
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(
+            f"No hay almacén de modelos para {config['experiment_name']} en {manifest_path}, "
+            "ejecutar primero 'train'"
+        )
+    
+    store = EnsembleStore(manifest_path)
+    try:
+        df_valid = load_dataset(path_parquet=dataset_path, months=val_months)
+        return store.predict(df_valid)
+    finally:
+        store.close()
+
+def _plan_config(config: dict, fingerprint: str, val_months: list[int]) -> dict:
+    """Resuelve qué parte de una config sale de cache y qué modelos hay que entrenar"""
+    model_names = sorted(key for key in config.keys() if key.startswith("model_"))
+    plan = {
+        'config': config,
+        'model_names': model_names,
+        'config_key': config_cache_key(config, fingerprint, val_months),
+        'model_keys': {name: model_cache_key(config, name, fingerprint, val_months) for name in model_names},
+        'cached_models': {},
+        'models_to_train': [],
+    }
+    
+    # Sin el almacén de un modelo su predicción cacheada no alcanza: hay que reentrenarlo
+    has_store = {
+        name: not MODEL_STORE_ENABLED or model_store_exists(config, name, fingerprint)
+        for name in model_names
+    }
+    
+    plan['cached'] = result_cache_get(plan['config_key']) if all(has_store.values()) else None
+    if plan['cached'] is not None:
+        return plan
+    
+    for model_name in model_names:
+        cached_model = result_cache_get(plan['model_keys'][model_name]) if has_store[model_name] else None
+        if cached_model is not None:
+            plan['cached_models'][model_name] = cached_model
+        else:
+            plan['models_to_train'].append(model_name)
+    
+    return plan
+
+def _ensemble_models(config: dict, model_names: list[str], model_predictions: list[pl.DataFrame]) -> pl.DataFrame:
+    """Promedia las predicciones de los modelos de una config"""
     # Si hay múltiples modelos, ensamblar sus predicciones
     if len(model_predictions) > 1:
         logger.info(f"\n--- Ensamblando {len(model_predictions)} modelos ---")
@@ -733,45 +1703,265 @@ def execute_config(config: dict, dataset_path: str, val_months: list[int]) -> pl
     else:
         return model_predictions[0].select(['numero_de_cliente', 'foto_mes', 'y_pred_mean'])
 
+def _write_config_store_manifest(config: dict, model_names: list[str], fingerprint: str):
+    groups = {name: model_store_dir(config, name, fingerprint)[0] for name in model_names}
+    write_config_manifest(config_manifest_path(config, fingerprint), config['experiment_name'], groups)
+
+def _consume_config(
+    plan: dict,
+    prefetch_queue: queue.Queue,
+    slots: _PrefetchSlots,
+    fingerprint: str,
+    df_valid: pl.DataFrame | None,
+    val_months: list[int]
+) -> pl.DataFrame:
+    """Entrena los modelos de una config con los Datasets que prepara el loader"""
+    config = plan['config']
+    experiment_name = config['experiment_name']
+    model_names = plan['model_names']
+    logger.info(f"=== Ejecutando {experiment_name} ===")
+    logger.info(f"Modelos a ejecutar: {model_names}")
+    
+    if plan['cached'] is not None:
+        if MODEL_STORE_ENABLED:
+            _write_config_store_manifest(config, model_names, fingerprint)
+        return plan['cached']
+    
+    model_predictions = []
+    
+    for model_name in model_names:
+        if model_name in plan['cached_models']:
+            logger.info(f"\n--- {model_name} recuperado de cache ---")
+            model_predictions.append(plan['cached_models'].pop(model_name))
+            continue
+        
+        item = prefetch_queue.get()
+        if isinstance(item, BaseException):
+            raise item
+        _, _, dtrain, features_train = item
+        
+        store_writer = None
+        if MODEL_STORE_ENABLED:
+            store_dir, group_key = model_store_dir(config, model_name, fingerprint)
+            store_writer = EnsembleStoreWriter(store_dir, model_name, group_key, features_train)
+        
+        try:
+            pred_final_model = _train_semillerio(
+                config, model_name, dtrain, features_train, df_valid, val_months, fingerprint,
+                store_writer=store_writer
+            )
+        except BaseException:
+            if store_writer is not None:
+                store_writer.abort()
+            raise
+        
+        if store_writer is not None:
+            store_writer.close()
+        
+        # Guardar predicción final de este modelo
+        pred_final_model = pred_final_model.select(['numero_de_cliente', 'foto_mes', 'y_pred_mean'])
+        result_cache_put(plan['model_keys'][model_name], pred_final_model)
+        model_predictions.append(pred_final_model)
+        
+        del item, dtrain, pred_final_model
+        gc.collect()
+        slots.release()
+    
+    if MODEL_STORE_ENABLED:
+        _write_config_store_manifest(config, model_names, fingerprint)
+    
+    pred_config = _ensemble_models(config, model_names, model_predictions)
+    result_cache_put(plan['config_key'], pred_config)
+    return pred_config
+
+def execute_configs(configs: list[dict], dataset_path: str, val_months: list[int]) -> list[pl.DataFrame]:
+    """
+    Ejecuta varias configuraciones en orden y retorna sus predicciones finales.
+    Un único loader prepara los Datasets de todos los modelos de todas las configs,
+    así la carga del primer modelo de una config se solapa con el último de la anterior.
+    """
+    fingerprint = dataset_fingerprint(dataset_path)
+    plans = [_plan_config(config, fingerprint, val_months) for config in configs]
+    
+    jobs = [
+        (plan['config'], model_name)
+        for plan in plans if plan['cached'] is None
+        for model_name in plan['models_to_train']
+    ]
+    
+    df_valid = load_dataset(path_parquet=dataset_path, months=val_months) if jobs else None
+    
+    # Un hilo carga el Dataset del próximo modelo mientras se entrena el actual
+    prefetch_queue = queue.Queue()
+    slots = _PrefetchSlots(PREFETCH_MAX_DEPTH + 1)
+    stop_event = threading.Event()
+    loader = threading.Thread(
+        target=_prefetch_train_datasets,
+        args=(jobs, dataset_path, prefetch_queue, slots, stop_event),
+        daemon=True
+    )
+    loader.start()
+    
+    try:
+        return [
+            _consume_config(plan, prefetch_queue, slots, fingerprint, df_valid, val_months)
+            for plan in plans
+        ]
+    finally:
+        stop_event.set()
+        loader.join()
+
+def execute_config(config: dict, dataset_path: str, val_months: list[int]) -> pl.DataFrame:
+    """Ejecuta una configuración completa y retorna predicciones finales"""
+    return execute_configs([config], dataset_path, val_months)[0]
+
 # ============================================================================
-# FUNCIÓN PRINCIPAL
+# BACKTEST
 # ============================================================================
 
-def main():
-    """Función principal"""
-    logger.info("=" * 80)
-    logger.info("INICIANDO ENSAMBLE STANDALONE")
-    logger.info("=" * 80)
+def config_for_window(config: dict, train_until: int, num_threads: int | None = None) -> dict:
+    """Copia de la config que entrena cada modelo solo con meses <= train_until"""
+    window_config = copy.deepcopy(config)
     
-    logger.info("\n[1/5] Descargando dataset desde GCS...")
-    download_dataset_from_gcs(DATASET_GCS_URL, LOCAL_DATASET_PATH)
+    for model_name in [key for key in config.keys() if key.startswith("model_")]:
+        months = [m for m in config[model_name]['months'] if m <= train_until]
+        if not months:
+            logger.warning(f"{config['experiment_name']}/{model_name} sin meses <= {train_until}, se omite")
+            del window_config[model_name]
+            continue
+        window_config[model_name]['months'] = months
     
-    logger.info("\n[2/5] Ejecutando Config 1...")
-    pred_config1 = execute_config(CONFIG_1, LOCAL_DATASET_PATH, VAL_MONTH)
+    if not any(key.startswith("model_") for key in window_config.keys()):
+        raise ValueError(f"Ningún modelo de {config['experiment_name']} tiene meses <= {train_until}")
     
-    logger.info("\n[3/5] Ejecutando Config 2...")
-    pred_config2 = execute_config(CONFIG_2, LOCAL_DATASET_PATH, VAL_MONTH)
+    if num_threads is not None:
+        window_config['fixed_params'] = {**window_config['fixed_params'], 'num_threads': num_threads}
     
-    logger.info("\n[4/5] Ensamblando predicciones finales...")
+    return window_config
+
+def _single_model_config(config: dict, model_name: str) -> dict:
+    """Config con un único modelo, para entrenarlo por separado del resto"""
+    return {
+        'experiment_name': f"{config['experiment_name']}_{model_name}",
+        'fixed_params': config['fixed_params'],
+        model_name: config[model_name],
+    }
+
+def _backtest_window_table(
+    configs: list[dict],
+    window_configs: list[dict],
+    window: dict,
+    model_preds: dict[str, pl.DataFrame],
+    fingerprint: str,
+    df_labels: pl.DataFrame
+) -> pl.DataFrame:
+    """Ganancia por mes de una ventana a partir de las predicciones de sus modelos"""
+    train_until = window['train_until']
+    val_months = window['val_months']
     
-    pred_config1_renamed = pred_config1.select(['numero_de_cliente', 'foto_mes', 'y_pred_mean']).rename(
-        {'y_pred_mean': 'y_pred_config1'}
-    )
-    pred_config2_renamed = pred_config2.select(['numero_de_cliente', 'foto_mes', 'y_pred_mean']).rename(
-        {'y_pred_mean': 'y_pred_config2'}
-    )
+    pred_configs = []
+    for window_config in window_configs:
+        model_names = sorted(key for key in window_config.keys() if key.startswith("model_"))
+        predictions = [
+            model_preds[model_store_dir(window_config, name, fingerprint)[1]]
+            .filter(pl.col('foto_mes').is_in(val_months))
+            for name in model_names
+        ]
+        pred_configs.append(_ensemble_models(window_config, model_names, predictions))
     
-    ensemble_final = pred_config1_renamed.join(
-        pred_config2_renamed,
-        on=['numero_de_cliente', 'foto_mes'],
-        how='full',
-        coalesce=True
-    )
+    tabla = None
+    preds_con_nombre = [(config['experiment_name'], pred) for config, pred in zip(configs, pred_configs)]
+    preds_con_nombre.append(('ensamble', ensemble_configs(pred_configs)))
+    
+    for nombre, pred_df in preds_con_nombre:
+        ganancia = calcular_ganancia_por_mes(pred_df, df_labels, n_submissions=N_SUBMISSIONS).rename(
+            {'ganancia': f'ganancia_{nombre}'}
+        )
+        if tabla is None:
+            tabla = ganancia
+        else:
+            tabla = tabla.join(ganancia, on='foto_mes', how='full', coalesce=True)
     
-    # Promediar predicciones
-    ensemble_final = ensemble_final.with_columns(
-        ((pl.col('y_pred_config1') + pl.col('y_pred_config2')) / 2.0).alias('y_pred_mean')
+    return tabla.with_columns(pl.lit(train_until).alias('train_until')).select(
+        ['train_until', 'foto_mes'] + [c for c in tabla.columns if c.startswith('ganancia_')]
     )
+
+def run_backtest(
+    configs: list[dict],
+    dataset_path: str,
+    windows: list[dict],
+    n_workers: int = 1
+) -> pl.DataFrame:
+    """
+    Backtesting en varias ventanas. Los modelos que quedan iguales en más de una ventana
+    (por ej. model_2019 con cualquier train_until posterior a 2019) se entrenan una sola
+    vez y se predicen todos los meses de validación juntos. Los modelos únicos se reparten
+    en n_workers pipelines en paralelo.
+    """
+    n_workers = max(1, n_workers)
+    # Repartir los cores entre los pipelines que entrenan a la vez
+    num_threads = max(1, (os.cpu_count() or 1) // n_workers) if n_workers > 1 else None
+    
+    fingerprint = dataset_fingerprint(dataset_path)
+    val_months_all = sorted({m for window in windows for m in window['val_months']})
+    window_configs = [
+        [config_for_window(config, window['train_until'], num_threads=num_threads) for config in configs]
+        for window in windows
+    ]
+    
+    # Un modelo por clave de almacén: misma config, features y dataset -> mismos boosters
+    unique_models = {}
+    n_jobs = 0
+    for configs_window in window_configs:
+        for window_config in configs_window:
+            for model_name in sorted(key for key in window_config.keys() if key.startswith("model_")):
+                _, group_key = model_store_dir(window_config, model_name, fingerprint)
+                unique_models.setdefault(group_key, _single_model_config(window_config, model_name))
+                n_jobs += 1
+    logger.info(f"Backtest: {len(unique_models)} modelos únicos para {n_jobs} (ventana, modelo)")
+    
+    group_keys = list(unique_models)
+    chunks = [chunk for chunk in (group_keys[i::n_workers] for i in range(n_workers)) if chunk]
+    
+    def run_chunk(chunk: list[str]) -> list[pl.DataFrame]:
+        return execute_configs([unique_models[key] for key in chunk], dataset_path, val_months_all)
+    
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        results = list(executor.map(run_chunk, chunks))
+    
+    model_preds = {
+        key: pred for chunk, preds in zip(chunks, results) for key, pred in zip(chunk, preds)
+    }
+    
+    df_labels = load_labels(dataset_path, val_months_all)
+    tablas = [
+        _backtest_window_table(configs, configs_window, window, model_preds, fingerprint, df_labels)
+        for window, configs_window in zip(windows, window_configs)
+    ]
+    
+    return pl.concat(tablas, how='vertical').sort(['train_until', 'foto_mes'])
+
+# ============================================================================
+# FUNCIÓN PRINCIPAL
+# ============================================================================
+
+CONFIGS = {
+    'config1': CONFIG_1,
+    'config2': CONFIG_2,
+}
+
+def predictions_path(config: dict) -> str:
+    """Archivo con las predicciones finales de una config"""
+    return os.path.join(PREDICTIONS_DIR, f"{config['experiment_name']}.parquet")
+
+def save_predictions(config: dict, pred_df: pl.DataFrame):
+    os.makedirs(PREDICTIONS_DIR, exist_ok=True)
+    pred_df.write_parquet(predictions_path(config))
+    logger.info(f"Predicciones de {config['experiment_name']} guardadas en {predictions_path(config)}")
+
+def write_submission(pred_configs: list[pl.DataFrame], output_file: str = OUTPUT_FILE) -> pl.DataFrame:
+    """Promedia las configs, selecciona el top N_SUBMISSIONS y lo guarda"""
+    ensemble_final = ensemble_configs(pred_configs)
     
     # Seleccionar top 11000
     ensemble_final = (
@@ -782,10 +1972,6 @@ def main():
         .select('numero_de_cliente')
     )
     
-    # 5. Guardar resultado final
-    logger.info("\n[5/5] Guardando resultado final...")
-    output_file = "ensamble_meses_11000.csv"
-    
     ensemble_final.select('numero_de_cliente').write_csv(
         output_file, 
         include_header=False
@@ -793,10 +1979,173 @@ def main():
     logger.info(f"Resultado guardado en {output_file}")
     logger.info(f"Total de clientes seleccionados: {ensemble_final.height}")
     
+    return ensemble_final
+
+def _require_dataset(dataset_path: str):
+    if not os.path.exists(dataset_path):
+        raise FileNotFoundError(f"No existe {dataset_path}, ejecutar primero la etapa 'fetch'")
+
+def main_backtest(dataset_path: str = LOCAL_DATASET_PATH, n_workers: int = BACKTEST_N_WORKERS):
+    """Backtesting multi-mes de Config 1, Config 2 y su ensamble"""
+    logger.info("=" * 80)
+    logger.info("INICIANDO BACKTEST")
+    logger.info("=" * 80)
+    
+    _require_dataset(dataset_path)
+    
+    tabla = run_backtest(
+        [CONFIG_1, CONFIG_2],
+        dataset_path,
+        BACKTEST_WINDOWS,
+        n_workers=n_workers
+    )
+    
+    tabla.write_csv(BACKTEST_OUTPUT_FILE)
+    logger.info(f"Ganancias por mes:\n{tabla}")
+    logger.info(f"Tabla guardada en {BACKTEST_OUTPUT_FILE}")
+
+def main():
+    """Función principal"""
+    logger.info("=" * 80)
+    logger.info("INICIANDO ENSAMBLE STANDALONE")
+    logger.info("=" * 80)
+    
+    logger.info("\n[1/5] Descargando dataset desde GCS...")
+    download_dataset_from_gcs(DATASET_GCS_URL, LOCAL_DATASET_PATH)
+    
+    logger.info("\n[2/5] Ejecutando Config 1 y Config 2...")
+    pred_config1, pred_config2 = execute_configs([CONFIG_1, CONFIG_2], LOCAL_DATASET_PATH, VAL_MONTH)
+    
+    logger.info("\n[3/5] Guardando predicciones de cada config...")
+    save_predictions(CONFIG_1, pred_config1)
+    save_predictions(CONFIG_2, pred_config2)
+    
+    logger.info("\n[4/5] Ensamblando predicciones finales...")
+    
+    # 5. Guardar resultado final
+    logger.info("\n[5/5] Guardando resultado final...")
+    write_submission([pred_config1, pred_config2], OUTPUT_FILE)
+    
     logger.info("\n" + "=" * 80)
     logger.info("PROCESO COMPLETADO")
     logger.info("=" * 80)
 
-if __name__ == "__main__":
+# ============================================================================
+# LÍNEA DE COMANDOS
+# ============================================================================
+
+def _selected_configs(args) -> list[dict]:
+    names = args.configs or sorted(CONFIGS)
+    for name in names:
+        if name not in CONFIGS:
+            raise ValueError(f"Config '{name}' no encontrada, opciones: {sorted(CONFIGS)}")
+    return [CONFIGS[name] for name in names]
+
+def cmd_fetch(args):
+    download_dataset_from_gcs(args.url, args.dataset)
+
+def cmd_features(args):
+    write_feature_dataset(args.base, args.output, args.sets)
+
+def cmd_check_features(args):
+    _require_dataset(args.dataset)
+    features = []
+    for feature_set in args.sets:
+        features.extend(FEATURE_SETS[feature_set])
+    report = check_features(args.dataset, features, args.month)
+    report.write_csv(args.output)
+    logger.info(f"Chequeo de features:\n{report}")
+    logger.info(f"Reporte guardado en {args.output}")
+
+def cmd_train(args):
+    _require_dataset(args.dataset)
+    configs = _selected_configs(args)
+    for config, pred_df in zip(configs, execute_configs(configs, args.dataset, args.months)):
+        save_predictions(config, pred_df)
+
+def cmd_predict(args):
+    _require_dataset(args.dataset)
+    for config in _selected_configs(args):
+        save_predictions(config, predict_from_store(config, args.dataset, args.months))
+
+def cmd_ensemble(args):
+    pred_configs = []
+    for config in _selected_configs(args):
+        path = predictions_path(config)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"No existe {path}, ejecutar primero 'train' o 'predict' para {config['experiment_name']}"
+            )
+        pred_configs.append(pl.read_parquet(path))
+    write_submission(pred_configs, args.output)
+
+def cmd_benchmark(args):
+    main_backtest(args.dataset, n_workers=args.workers)
+
+def cmd_run(args):
     main()
 
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Reproduce el envío o corre solo algunas etapas desde los artefactos guardados"
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    
+    def add_dataset(sub):
+        sub.add_argument('--dataset', default=LOCAL_DATASET_PATH, help="Parquet local del dataset")
+    
+    def add_configs(sub):
+        sub.add_argument('configs', nargs='*', metavar='CONFIG',
+                         help=f"Configs a procesar: {', '.join(sorted(CONFIGS))} (por defecto todas)")
+    
+    sub = subparsers.add_parser('run', help="Pipeline completo (comportamiento por defecto)")
+    sub.set_defaults(func=cmd_run)
+    
+    sub = subparsers.add_parser('fetch', help="Descarga el dataset desde GCS")
+    sub.add_argument('--url', default=DATASET_GCS_URL)
+    add_dataset(sub)
+    sub.set_defaults(func=cmd_fetch)
+    
+    sub = subparsers.add_parser('features', help="Genera un dataset con solo las features de los sets elegidos")
+    sub.add_argument('--base', required=True, help="Parquet con la tabla mensual base")
+    sub.add_argument('--output', required=True)
+    sub.add_argument('--sets', nargs='+', choices=sorted(FEATURE_SETS), default=sorted(FEATURE_SETS))
+    sub.set_defaults(func=cmd_features)
+    
+    sub = subparsers.add_parser('check-features', help="Compara las features derivadas con las del dataset")
+    add_dataset(sub)
+    sub.add_argument('--month', type=int, default=VAL_MONTH[0])
+    sub.add_argument('--sets', nargs='+', choices=sorted(FEATURE_SETS), default=sorted(FEATURE_SETS))
+    sub.add_argument('--output', default="chequeo_features.csv")
+    sub.set_defaults(func=cmd_check_features)
+    
+    sub = subparsers.add_parser('train', help="Entrena configs y guarda predicciones y modelos")
+    add_configs(sub)
+    add_dataset(sub)
+    sub.add_argument('--months', nargs='+', type=int, default=VAL_MONTH)
+    sub.set_defaults(func=cmd_train)
+    
+    sub = subparsers.add_parser('predict', help="Predice con los modelos guardados, sin reentrenar")
+    add_configs(sub)
+    add_dataset(sub)
+    sub.add_argument('--months', nargs='+', type=int, default=VAL_MONTH)
+    sub.set_defaults(func=cmd_predict)
+    
+    sub = subparsers.add_parser('ensemble', help="Ensambla las predicciones guardadas y genera el envío")
+    add_configs(sub)
+    sub.add_argument('--output', default=OUTPUT_FILE)
+    sub.set_defaults(func=cmd_ensemble)
+    
+    sub = subparsers.add_parser('benchmark', aliases=['backtest'], help="Ganancia por mes en BACKTEST_WINDOWS")
+    add_dataset(sub)
+    sub.add_argument('--workers', type=int, default=BACKTEST_N_WORKERS)
+    sub.set_defaults(func=cmd_benchmark)
+    
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.command is None:
+        main()
+    else:
+        args.func(args)